@@ -1,12 +1,12 @@
 # app.py
 import streamlit as st
 import pandas as pd
-import requests
 import os 
 from pathlib import Path
 
-from utils.load_data import load_all_data, load_reviews
+from utils.load_data import load_all_data, load_point_indexes, load_reviews
 from utils.geospatial import get_dguid_from_latlon
+from utils.geocoding import geocode_address
 from sections import population_stats, competitors, hospitals, sentiment_physio
 
 st.set_page_config(page_title="Arrow Physio Dashboard", layout="wide")
@@ -24,18 +24,10 @@ def get_gcp_key():
 
 gcp_api_key = get_gcp_key()
 
-def geocode_address(address, api_key):
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={api_key}"
-    response = requests.get(url).json()
-    if response["status"] == "OK":
-        result = response["results"][0]
-        location = result["geometry"]["location"]
-        return location["lat"], location["lng"], result["formatted_address"]
-    return None, None, None
-
 # Load data once
-df_reduced, gdf_physio, gdf_hospitals = load_all_data()
-pcr_reviews, _ = load_reviews()
+df_reduced, gdf_physio, gdf_hospitals, data_version = load_all_data()
+physio_index, hospitals_index = load_point_indexes()
+pcr_reviews, _, reviews_version = load_reviews()
 
 # Session state
 for key in ["address", "lat", "lon", "formatted_address", "run_analysis"]:
@@ -45,13 +37,16 @@ for key in ["address", "lat", "lon", "formatted_address", "run_analysis"]:
 # ------------------------- MAIN UI -------------------------
 
 st.subheader("🏠 Step 1: Enter Clinic Address")
-address_input = st.text_input(
-    "Enter clinic address",
-    value=st.session_state.address,
-    placeholder="e.g. 125 Bronte Rd, Oakville"
-)
+# A form only reruns the script (and geocodes) when the address is submitted
+with st.form("address_form"):
+    address_input = st.text_input(
+        "Enter clinic address",
+        value=st.session_state.address,
+        placeholder="e.g. 125 Bronte Rd, Oakville"
+    )
+    submitted = st.form_submit_button("📍 Find address")
 
-if address_input != st.session_state.address and address_input.strip():
+if submitted and address_input != st.session_state.address and address_input.strip():
     lat, lon, formatted_address = geocode_address(address_input, gcp_api_key)
     if lat and lon:
         st.session_state.update({
@@ -80,9 +75,13 @@ if st.session_state.run_analysis and st.session_state.lat and st.session_state.l
     dguid = get_dguid_from_latlon(st.session_state.lat, st.session_state.lon, df_reduced)
     if dguid:
         st.success(f"✅ DGUID Found: {dguid}")
-        population_stats.render(df_reduced, dguid, st.session_state.lat, st.session_state.lon)
-        competitors.render(gdf_physio, dguid, st.session_state.lat, st.session_state.lon, df_reduced)
-        hospitals.render(st.session_state.lat, st.session_state.lon, dguid, gdf_physio, gdf_hospitals)
-        sentiment_physio.render(dguid, pcr_reviews)
+        # Sections with filters are fragments: moving a slider reruns only that section
+        # data_version / reviews_version key each section's caches of the loaded frames
+        population_stats.render(df_reduced, dguid, st.session_state.lat, st.session_state.lon, data_version)
+        competitors.render(gdf_physio, dguid, st.session_state.lat, st.session_state.lon, df_reduced,
+                           data_version, physio_index)
+        hospitals.render(st.session_state.lat, st.session_state.lon, dguid, gdf_physio, gdf_hospitals,
+                         data_version, physio_index, hospitals_index)
+        sentiment_physio.render(dguid, pcr_reviews, reviews_version)
     else:
         st.error("❌ No matching DGUID found for this location.")
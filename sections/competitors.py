@@ -2,12 +2,89 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
-import pydeck as pdk
-import matplotlib.pyplot as plt
 
+from utils.geospatial import dguid_mask, within_radius
 
-def render(gdf_physio, dguid, lat, lon, df_reduced):
+
+GTA_METRICS = ["PopPerClinic", "ClinicsPer1000", "ReviewsPer1000"]
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _gta_baselines(version, _gdf_physio, _df_reduced):
+    """
+    Per-DGUID clinic metrics for the whole GTA plus their median and mean baselines.
+    Only depends on the (cached, read-only) input frames, so it is computed once per loaded
+    dataset; `version` (the data_version from load_all_data) identifies them without hashing.
+    """
+    df_tmp = pd.DataFrame(_df_reduced[["DGUID", "Population, 2021"]])
+
+    # One pass over the clinics: count, review total and mean rating per DGUID
+    clinic_stats = (
+        _gdf_physio.groupby("DGUID", sort=False, observed=True)
+        .agg(
+            **{
+                "Num_Clinics": ("Rating", "size"),
+                "Total_Reviews": ("User Ratings Total", "sum"),
+                "Average_Rating": ("Rating", "mean"),
+            }
+        )
+        .reset_index()
+    )
+    df_tmp = df_tmp.merge(clinic_stats, on="DGUID", how="left")
+    df_tmp["Num_Clinics"] = df_tmp["Num_Clinics"].fillna(0)
+    df_tmp["Total_Reviews"] = df_tmp["Total_Reviews"].fillna(0)
+    df_tmp["Average_Rating"] = df_tmp["Average_Rating"].fillna(0)
+
+    pop = df_tmp["Population, 2021"].astype(float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df_tmp["PopPerClinic"] = np.where(
+            df_tmp["Num_Clinics"] > 0, pop / df_tmp["Num_Clinics"], np.nan
+        )
+        df_tmp["ClinicsPer1000"] = np.where(
+            pop > 0, (df_tmp["Num_Clinics"] / pop) * 1000, np.nan
+        )
+        df_tmp["ReviewsPer1000"] = np.where(
+            pop > 0, (df_tmp["Total_Reviews"] / pop) * 1000, np.nan
+        )
+
+    for col in GTA_METRICS + ["Average_Rating"]:
+        df_tmp[col] = pd.to_numeric(df_tmp[col], errors="coerce").replace(
+            [np.inf, -np.inf], np.nan
+        )
+
+    medians = {col: df_tmp[col].median(skipna=True) for col in GTA_METRICS}
+    means = {col: df_tmp[col].mean(skipna=True) for col in GTA_METRICS}
+
+    # Average rating is always the mean over DGUIDs that have rated clinics
+    gta_avg_rating = df_tmp.loc[
+        df_tmp["Average_Rating"] > 0, "Average_Rating"
+    ].mean(skipna=True)
+    medians["Average_Rating"] = means["Average_Rating"] = gta_avg_rating
+
+    return df_tmp, medians, means
+
+
+def _histogram(values, selected, title, color, rule_color, bins=20, domain=None, x_title=None):
+    """Binned count histogram of `values` with a dashed rule at the selected location's value."""
+    import altair as alt
+
+    binning = alt.Bin(maxbins=bins, extent=domain) if domain else alt.Bin(maxbins=bins)
+    scale = alt.Scale(domain=domain) if domain else alt.Scale()
+    bars = alt.Chart(pd.DataFrame({"value": values})).mark_bar(color=color).encode(
+        x=alt.X("value:Q", bin=binning, scale=scale, title=x_title or title),
+        y=alt.Y("count()", title="Number of DGUIDs"),
+    )
+    if pd.notnull(selected):
+        rule = alt.Chart(pd.DataFrame({"value": [selected]})).mark_rule(
+            color=rule_color, strokeDash=[6, 4], size=2
+        ).encode(x="value:Q", tooltip=alt.Tooltip("value:Q", title="Selected", format=",.2f"))
+        bars = bars + rule
+    return bars.properties(title=title, height=280)
+
+
+@st.experimental_fragment
+def render(gdf_physio, dguid, lat, lon, df_reduced, data_version, physio_index=None):
     st.header("🏥 Nearby Competitors (Physio Clinics)")
 
     # ---------------------------------------------------------
@@ -55,19 +132,16 @@ def render(gdf_physio, dguid, lat, lon, df_reduced):
     # ---------------------------------------------------------
     # Filter clinics within radius
     # ---------------------------------------------------------
-    input_point = (lat, lon)
-
-    def _dist_km(row):
-        return geodesic(input_point, (row["Latitude"], row["Longitude"])).km
+    # Memoized per session: toggling only the GTA method (or any no-op rerun) reuses the last result
+    filter_key = (data_version, round(lat, 5), round(lon, 5), radius_km, min_rating, dedup)
+    if st.session_state.get("_comp_filter_key") != filter_key:
+        nearby = within_radius(gdf_physio, lat, lon, radius_km, physio_index)
+        if dedup:
+            nearby = nearby.drop_duplicates(subset=["Name", "Address"])
 
-    gdf_physio = gdf_physio.copy()
-    gdf_physio["Distance_km"] = gdf_physio.apply(_dist_km, axis=1)
-
-    nearby = gdf_physio[gdf_physio["Distance_km"] <= radius_km].copy()
-    if dedup:
-        nearby = nearby.drop_duplicates(subset=["Name", "Address"])
-
-    combined = nearby.query("Rating >= @min_rating").copy()
+        st.session_state["_comp_filter_result"] = nearby.query("Rating >= @min_rating")
+        st.session_state["_comp_filter_key"] = filter_key
+    combined = st.session_state["_comp_filter_result"]
 
     # ---------------------------------------------------------
     # Data table
@@ -86,9 +160,11 @@ def render(gdf_physio, dguid, lat, lon, df_reduced):
     # ---------------------------------------------------------
     st.subheader("🗺️ Map of Clinics & Your Location")
     if not combined.empty:
+        import pydeck as pdk  # heavy; only imported once a map is drawn
+
         clinics_layer = pdk.Layer(
             "ScatterplotLayer",
-            data=combined.rename(columns={"Latitude": "lat", "Longitude": "lon"}),
+            data=combined[["Latitude", "Longitude"]].rename(columns={"Latitude": "lat", "Longitude": "lon"}),
             get_position="[lon, lat]",
             get_color="[255, 0, 0]",
             get_radius=25,
@@ -117,11 +193,9 @@ def render(gdf_physio, dguid, lat, lon, df_reduced):
     st.subheader("📊 Competitiveness Metrics")
 
     dguids_in_radius = combined["DGUID"].unique()
-    dguid_stats = df_reduced[df_reduced["DGUID"].isin(dguids_in_radius)].copy()
-
-    total_population = pd.to_numeric(
-        dguid_stats["Population, 2021"], errors="coerce"
-    ).sum(skipna=True)
+    total_population = df_reduced.loc[
+        df_reduced["DGUID"].isin(dguids_in_radius), "Population, 2021"
+    ].sum(skipna=True)
 
     num_clinics = len(combined)
     pop_per_clinic_sel = (total_population / num_clinics) if num_clinics > 0 else np.nan
@@ -135,61 +209,14 @@ def render(gdf_physio, dguid, lat, lon, df_reduced):
     )
 
     # ---------------------------------------------------------
-    # Build GTA baselines safely
+    # GTA baselines (cached, independent of the user's inputs)
     # ---------------------------------------------------------
-    df_tmp = df_reduced.copy()
-    df_tmp["Population, 2021"] = pd.to_numeric(
-        df_tmp["Population, 2021"], errors="coerce"
-    )
-
-    clinic_counts = gdf_physio.groupby("DGUID").size().reset_index(name="Num_Clinics")
-    df_tmp = df_tmp.merge(clinic_counts, on="DGUID", how="left")
-    df_tmp["Num_Clinics"] = df_tmp["Num_Clinics"].fillna(0)
-
-    agg_reviews = (
-        gdf_physio.groupby("DGUID")
-        .agg(
-            **{
-                "Total_Reviews": ("User Ratings Total", "sum"),
-                "Average_Rating": ("Rating", "mean"),
-            }
-        )
-        .reset_index()
-    )
-    df_tmp = df_tmp.merge(agg_reviews, on="DGUID", how="left")
-    df_tmp["Total_Reviews"] = df_tmp["Total_Reviews"].fillna(0)
-    df_tmp["Average_Rating"] = df_tmp["Average_Rating"].fillna(0)
-
-    pop = df_tmp["Population, 2021"].astype(float)
-
-    with np.errstate(divide="ignore", invalid="ignore"):
-        df_tmp["PopPerClinic"] = np.where(
-            df_tmp["Num_Clinics"] > 0, pop / df_tmp["Num_Clinics"], np.nan
-        )
-        df_tmp["ClinicsPer1000"] = np.where(
-            pop > 0, (df_tmp["Num_Clinics"] / pop) * 1000, np.nan
-        )
-        df_tmp["ReviewsPer1000"] = np.where(
-            pop > 0, (df_tmp["Total_Reviews"] / pop) * 1000, np.nan
-        )
-
-    for col in ["PopPerClinic", "ClinicsPer1000", "ReviewsPer1000", "Average_Rating"]:
-        df_tmp[col] = pd.to_numeric(df_tmp[col], errors="coerce").replace(
-            [np.inf, -np.inf], np.nan
-        )
-
-    if "median" in gta_method.lower():
-        gta_pop_per_clinic = df_tmp["PopPerClinic"].median(skipna=True)
-        gta_clinics_per_1000 = df_tmp["ClinicsPer1000"].median(skipna=True)
-        gta_reviews_per_1000 = df_tmp["ReviewsPer1000"].median(skipna=True)
-    else:
-        gta_pop_per_clinic = df_tmp["PopPerClinic"].mean(skipna=True)
-        gta_clinics_per_1000 = df_tmp["ClinicsPer1000"].mean(skipna=True)
-        gta_reviews_per_1000 = df_tmp["ReviewsPer1000"].mean(skipna=True)
-
-    gta_avg_rating = df_tmp.loc[
-        df_tmp["Average_Rating"] > 0, "Average_Rating"
-    ].mean(skipna=True)
+    df_tmp, gta_medians, gta_means = _gta_baselines(data_version, gdf_physio, df_reduced)
+    gta = gta_medians if "median" in gta_method.lower() else gta_means
+    gta_pop_per_clinic = gta["PopPerClinic"]
+    gta_clinics_per_1000 = gta["ClinicsPer1000"]
+    gta_reviews_per_1000 = gta["ReviewsPer1000"]
+    gta_avg_rating = gta["Average_Rating"]
 
     def arrow_color(diff: float):
         arrow = "⬆️" if diff > 0 else "⬇️"
@@ -250,41 +277,26 @@ def render(gdf_physio, dguid, lat, lon, df_reduced):
     # GTA comparison histograms
     # ---------------------------------------------------------
     st.subheader("📈 Comparison to GTA")
+    import altair as alt
 
-    fig, axs = plt.subplots(2, 2, figsize=(12, 10))
-
-    axs[0, 0].hist(df_tmp["PopPerClinic"].dropna(), bins=20, color="skyblue")
-    if pd.notnull(pop_per_clinic_sel):
-        axs[0, 0].axvline(pop_per_clinic_sel, color="blue", linestyle="--", label="Selected")
-    axs[0, 0].set_title("Population per Clinic")
-    axs[0, 0].set_xlabel("People per Clinic")
-    axs[0, 0].set_ylabel("Number of DGUIDs")
-    axs[0, 0].legend()
-
-    row_sel = df_tmp[df_tmp["DGUID"] == dguid]
+    row_sel = df_tmp[dguid_mask(df_tmp["DGUID"], dguid)]
     selected_clinics_per_1000 = (
         row_sel["ClinicsPer1000"].iloc[0] if not row_sel.empty else clinics_per_1000_sel
     )
-    axs[0, 1].hist(df_tmp["ClinicsPer1000"].dropna().clip(upper=10), bins=20, color="lightgreen", alpha=0.7)
-    if pd.notnull(selected_clinics_per_1000):
-        axs[0, 1].axvline(min(selected_clinics_per_1000, 10), color="darkgreen", linestyle="--", label="Selected")
-    axs[0, 1].set_xlim(0, 10)
-    axs[0, 1].set_title("Clinics per 1,000 People")
-    axs[0, 1].legend()
-
     valid_ratings = df_tmp["Average_Rating"]
     valid_ratings = valid_ratings[valid_ratings > 0]
-    axs[1, 0].hist(valid_ratings, bins=5, color="gold")
-    if pd.notnull(avg_rating_sel):
-        axs[1, 0].axvline(avg_rating_sel, color="orange", linestyle="--", label="Selected")
-    axs[1, 0].set_title("Average Clinic Rating")
-    axs[1, 0].legend()
-
-    axs[1, 1].hist(df_tmp["ReviewsPer1000"].dropna().clip(upper=1000), bins=20, color="salmon")
-    if pd.notnull(reviews_per_1000_sel):
-        axs[1, 1].axvline(min(reviews_per_1000_sel, 1000), color="red", linestyle="--", label="Selected")
-    axs[1, 1].set_xlim(0, 1000)
-    axs[1, 1].set_title("Reviews per 1,000 People")
-    axs[1, 1].legend()
-
-    st.pyplot(fig)
+
+    charts = [
+        _histogram(df_tmp["PopPerClinic"].dropna(), pop_per_clinic_sel,
+                   "Population per Clinic", "skyblue", "blue", x_title="People per Clinic"),
+        _histogram(df_tmp["ClinicsPer1000"].dropna().clip(upper=10),
+                   min(selected_clinics_per_1000, 10) if pd.notnull(selected_clinics_per_1000) else np.nan,
+                   "Clinics per 1,000 People", "lightgreen", "darkgreen", domain=[0, 10]),
+        _histogram(valid_ratings, avg_rating_sel,
+                   "Average Clinic Rating", "gold", "orange", bins=5),
+        _histogram(df_tmp["ReviewsPer1000"].dropna().clip(upper=1000),
+                   min(reviews_per_1000_sel, 1000) if pd.notnull(reviews_per_1000_sel) else np.nan,
+                   "Reviews per 1,000 People", "salmon", "red", domain=[0, 1000]),
+    ]
+    # Vega-Lite spec rendered client-side; each panel keeps its own bins/range, hence concat not facet
+    st.altair_chart(alt.concat(*charts, columns=2), use_container_width=True)
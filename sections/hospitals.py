@@ -2,60 +2,47 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
-import geopandas as gpd
 import re
-import pydeck as pdk
+
+from utils.geospatial import within_radius
 
 # --------------------------
 # Regex patterns for facility filtering
 # --------------------------
 PAT_INCLUDE = re.compile(
-    r"(hospital|emergency|urgent\s*care|walk[-\s]?in|after[-\s]?hours|"
-    r"medical\s*(centre|center|clinic)|primary\s*care|doctor\b|physician\b|"
-    r"community\s*health\s*(centre|center)|family\s*health\s*(team|clinic|centre|center)|health\s*hub)",
+    r"(?:hospital|emergency|urgent\s*care|walk[-\s]?in|after[-\s]?hours|"
+    r"medical\s*(?:centre|center|clinic)|primary\s*care|doctor\b|physician\b|"
+    r"community\s*health\s*(?:centre|center)|family\s*health\s*(?:team|clinic|centre|center)|health\s*hub)",
     re.I,
 )
-PAT_EXCLUDE = re.compile(r"(chiro|chiropractic|osteopath|osteopathy|massage|spa\b|acupuncture|naturopath)", re.I)
+PAT_EXCLUDE = re.compile(r"(?:chiro|chiropractic|osteopath|osteopathy|massage|spa\b|acupuncture|naturopath)", re.I)
 ALLOWLIST = ["pinpoint health", "infinity health", "appletree", "jack nathan"]
+PAT_ALLOW = re.compile("|".join(map(re.escape, ALLOWLIST)), re.I)
 
 # --------------------------
 # Helper functions
 # --------------------------
-def _ensure_lat_lon(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    lat_col = next((c for c in df.columns if c.lower() in ("latitude", "lat")), None)
-    lon_col = next((c for c in df.columns if c.lower() in ("longitude", "lon")), None)
-    if lat_col and lon_col:
-        df["Latitude"] = pd.to_numeric(df[lat_col], errors="coerce")
-        df["Longitude"] = pd.to_numeric(df[lon_col], errors="coerce")
-        return df
-    if "geometry" in df.columns:
-        gdf = df if isinstance(df, gpd.GeoDataFrame) else gpd.GeoDataFrame(df, geometry="geometry", crs=None)
-        try:
-            gdf = gdf.set_crs("EPSG:4326", allow_override=True) if gdf.crs is None else gdf.to_crs("EPSG:4326")
-        except Exception:
-            pass
-        cent = gdf.geometry.centroid
-        df["Latitude"], df["Longitude"] = cent.y, cent.x
-        return df
-    raise ValueError("Hospitals data has no Latitude/Longitude or geometry.")
-
-
 def _keyword_support_mask(df: pd.DataFrame) -> pd.Series:
-    name = df.get("Name", pd.Series(index=df.index, dtype=str)).astype(str).str.lower()
-    addr = df.get("Address", pd.Series(index=df.index, dtype=str)).astype(str).str.lower()
-    types = df.get("types", pd.Series(index=df.index, dtype=str)).astype(str).str.lower()
-    blob = name + " " + addr + " " + types
+    # Matches on Name + Address only; the patterns are tuned for those, not for Places type tokens
+    name = df.get("Name", pd.Series("", index=df.index)).astype(str)
+    addr = df.get("Address", pd.Series("", index=df.index)).astype(str)
+    blob = name.str.cat(addr, sep=" ")
+    # All three patterns are case-insensitive and run on pandas' vectorized regex path
     include = blob.str.contains(PAT_INCLUDE)
     exclude = blob.str.contains(PAT_EXCLUDE)
-    allow = blob.apply(lambda x: any(a in x for a in ALLOWLIST))
+    allow = blob.str.contains(PAT_ALLOW)
     return (include | allow) & (~exclude)
 
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _support_mask(version: tuple, _df: pd.DataFrame) -> np.ndarray:
+    # The loaded frames are never mutated, so load_all_data's data_version identifies them across reruns
+    return _keyword_support_mask(_df).to_numpy()
+
 # --------------------------
 # Main render function
 # --------------------------
-def render(lat, lon, dguid, gdf_physio, gdf_hospitals):
+@st.experimental_fragment
+def render(lat, lon, dguid, gdf_physio, gdf_hospitals, data_version, physio_index=None, hospitals_index=None):
     st.header("🏥 Support Facilities (Hospitals & Walk-in Clinics)")
 
     # --------------------------
@@ -98,31 +85,26 @@ def render(lat, lon, dguid, gdf_physio, gdf_hospitals):
     # --------------------------
     # Data preparation
     # --------------------------
-    supp = _ensure_lat_lon(gdf_hospitals)
-    phys = _ensure_lat_lon(gdf_physio)
+    # Latitude/Longitude and the Name + Address duplicate flag are prepared in load_all_data
+    supp = gdf_hospitals
+    phys = gdf_physio
 
-    if dedup and all(c in supp.columns for c in ["Name", "Address"]):
-        supp = supp.drop_duplicates(subset=["Name", "Address"]).copy()
+    # Row mask over the full frame, so the radius lookup can use the prebuilt point index
+    keep = np.ones(len(supp), dtype=bool)
+    if dedup and "Is_Duplicate" in supp.columns:
+        keep &= ~supp["Is_Duplicate"].to_numpy()
 
     if apply_filter:
-        supp = supp[_keyword_support_mask(supp)].copy()
+        keep &= _support_mask(data_version, supp)
 
     # --------------------------
     # Distance + radius filter
     # --------------------------
-    input_point = (lat, lon)
-
-    def _dist(row):
-        return geodesic((row["Latitude"], row["Longitude"]), input_point).km
-
-    supp["Distance_km"] = supp.apply(_dist, axis=1)
-    phys["Distance_km"] = phys.apply(_dist, axis=1)
-
-    nearby_support = supp[supp["Distance_km"] <= radius_km].copy()
-    nearby_physios = phys[phys["Distance_km"] <= radius_km].copy()
+    nearby_support = within_radius(supp, lat, lon, radius_km, hospitals_index, mask=keep)
+    nearby_physios = within_radius(phys, lat, lon, radius_km, physio_index)
 
     st.caption(
-        f"Total facilities: {len(gdf_hospitals)} → after dedup/filter: {len(supp)} → within {radius_km} km: {len(nearby_support)}"
+        f"Total facilities: {len(gdf_hospitals)} → after dedup/filter: {int(keep.sum())} → within {radius_km} km: {len(nearby_support)}"
         + (" | filter=ON" if apply_filter else " | filter=OFF")
     )
 
@@ -138,8 +120,8 @@ def render(lat, lon, dguid, gdf_physio, gdf_hospitals):
     support_index = float((1.0 / (1.0 + nearby_support["Distance_km"])).sum()) if num_support > 0 else 0.0
 
     # GTA baselines
-    support_counts = supp.groupby("DGUID").size().rename("Support_Count")
-    physio_counts = phys.groupby("DGUID").size().rename("Physio_Count")
+    support_counts = supp.loc[keep, ["DGUID"]].groupby("DGUID", observed=True).size().rename("Support_Count")
+    physio_counts = phys[["DGUID"]].groupby("DGUID", observed=True).size().rename("Physio_Count")
     aligned = pd.DataFrame({"Support_Count": support_counts}).join(physio_counts, how="outer").fillna(0)
     with np.errstate(divide="ignore", invalid="ignore"):
         aligned["SupportPerPhysio"] = np.where(
@@ -183,9 +165,11 @@ def render(lat, lon, dguid, gdf_physio, gdf_hospitals):
     st.subheader("🗺️ Map of Support Facilities & Your Location")
 
     if not nearby_support.empty:
+        import pydeck as pdk  # heavy; only imported once a map is drawn
+
         support_layer = pdk.Layer(
             "ScatterplotLayer",
-            data=nearby_support.rename(columns={"Latitude": "lat", "Longitude": "lon"}),
+            data=nearby_support[["Latitude", "Longitude"]].rename(columns={"Latitude": "lat", "Longitude": "lon"}),
             get_position="[lon, lat]",
             get_color="[255, 0, 0]",   # red = hospitals/walk-ins
             get_radius=25,
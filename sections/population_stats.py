@@ -1,11 +1,16 @@
 from __future__ import annotations
+import re
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 import geopandas as gpd
+import pyproj
 from shapely.geometry import Point
-import matplotlib.pyplot as plt
+from shapely.ops import transform as shapely_transform
 import streamlit as st
 
+from utils.geospatial import dguid_mask
+
 # ---------------------- column helpers ----------------------
 
 def _normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
@@ -43,55 +48,87 @@ def _resolve_columns(df: pd.DataFrame) -> dict:
         resolved[key] = _find_col(cols, opts)
     return resolved
 
+_NON_NUMERIC = re.compile(r"[^0-9.\-]")
+
 def _to_numeric(s: pd.Series) -> pd.Series:
-    return pd.to_numeric(
-        s.astype("object").astype(str).str.replace(r"[^0-9.\-]", "", regex=True),
-        errors="coerce"
-    )
+    # Census columns are normally numeric already; only text values go through the regex clean-up
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("float64")
+    out = pd.to_numeric(s, errors="coerce")
+    if not out[s.notna()].isna().any():
+        return out
+    return pd.to_numeric(s.astype(str).str.replace(_NON_NUMERIC, "", regex=True), errors="coerce")
 
 # ---------------------- geospatial helper ----------------------
 
+@lru_cache(maxsize=16)
+def _aeqd_to_wgs84(lat: float, lon: float) -> pyproj.Transformer:
+    # Building a CRS + Transformer costs milliseconds; the point is fixed while the radius slider
+    # moves, so every step after the first reuses it (pyproj transformers are thread-safe)
+    aeqd = pyproj.CRS.from_proj4(f"+proj=aeqd +lat_0={lat} +lon_0={lon} +units=m +datum=WGS84")
+    return pyproj.Transformer.from_crs(aeqd, "EPSG:4326", always_xy=True)
+
 def _buffer_km(lat: float, lon: float, km: float) -> gpd.GeoSeries:
-    point = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326")
-    proj = point.to_crs(3857).buffer(km * 1000.0)
-    return proj.to_crs(4326)
+    # Buffer in an azimuthal equidistant projection centred on the point, where distances from the
+    # centre are true. A Web Mercator buffer came out ~cos(lat) too small (~0.72x the radius in the GTA).
+    to_ll = _aeqd_to_wgs84(float(lat), float(lon)).transform
+    circle = shapely_transform(to_ll, Point(0, 0).buffer(km * 1000.0))
+    return gpd.GeoSeries([circle], crs="EPSG:4326")
 
-# ---------------------- main render ----------------------
+# ---------------------- data prep ----------------------
 
-def render(df_reduced: gpd.GeoDataFrame, dguid: str, lat: float, lon: float):
-    st.header("👥 Population & Demographics")
+NUMERIC_KEYS = ["POP2021", "DENS", "GROWTH", "MED_INC_2020", "AVG_INC_2020",
+                "AGE_TOTAL", "AGE_0_14", "AGE_15_64", "AGE_65_PLUS", "AGE_85_PLUS"]
 
-    # --- Prep data
-    gdf = gpd.GeoDataFrame(_normalize_cols(df_reduced.copy()), geometry="geometry")
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _prepare_gdf(version: tuple, _df_reduced: gpd.GeoDataFrame) -> tuple[gpd.GeoDataFrame, dict]:
+    """
+    Normalized-column copy of df_reduced with the numeric aliases coerced and its own spatial
+    index, plus the resolved column mapping. Built once per loaded frame.
+    """
+    gdf = gpd.GeoDataFrame(_normalize_cols(_df_reduced), geometry="geometry")
     if gdf.crs is None:
         gdf.set_crs("EPSG:4326", inplace=True)
 
     cols = _resolve_columns(gdf)
 
-    for key in ["POP2021", "DENS", "GROWTH", "MED_INC_2020", "AVG_INC_2020",
-                "AGE_TOTAL", "AGE_0_14", "AGE_15_64", "AGE_65_PLUS", "AGE_85_PLUS"]:
+    for key in NUMERIC_KEYS:
         c = cols.get(key)
         if c and c in gdf.columns:
-            gdf[c] = _to_numeric(gdf[c])
+            # float64 with inf -> NaN, so the KPI reductions can use plain skipna mean/sum
+            gdf[c] = _to_numeric(gdf[c]).astype("float64").replace([np.inf, -np.inf], np.nan)
+    gdf.sindex  # built once per data version, with the cached frame
+    return gdf, cols
+
+# ---------------------- main render ----------------------
+
+@st.experimental_fragment
+def render(df_reduced: gpd.GeoDataFrame, dguid: str, lat: float, lon: float, data_version: tuple):
+    st.header("👥 Population & Demographics")
+
+    # --- Prep data
+    gdf, cols = _prepare_gdf(data_version, df_reduced)
 
     if cols["DGUID"] is None or cols["geometry"] is None:
         st.error("Required columns (DGUID, geometry) not found.")
         return
-    if dguid not in set(gdf[cols["DGUID"]].astype(str)):
+    sel = dguid_mask(gdf[cols["DGUID"]], dguid)
+    if not sel.any():
         st.warning(f"DGUID {dguid} not found in data.")
         return
 
-    row_sel = gdf[gdf[cols["DGUID"]].astype(str) == str(dguid)].iloc[0]
+    row_sel = gdf[sel].iloc[0]
 
     # --- Radius filter
     radius_km = st.slider("Radius (km) for aggregation", min_value=0.5, max_value=10.0, value=2.0, step=0.5)
     circle = _buffer_km(lat, lon, radius_km).iloc[0]
-    in_radius = gdf[gdf.geometry.intersects(circle)].copy()
+    hits = np.sort(gdf.sindex.query(circle, predicate="intersects"))
+    in_radius = gdf.iloc[hits]
     gta = gdf
 
     # --- Metric helpers
-    def mean_safe(df, k): c = cols[k]; return df[c].replace([np.inf, -np.inf], np.nan).dropna().astype(float).mean() if c else None
-    def sum_safe(df, k):  c = cols[k]; return df[c].replace([np.inf, -np.inf], np.nan).dropna().astype(float).sum() if c else None
+    def mean_safe(df, k): c = cols[k]; return float(df[c].mean()) if c else None
+    def sum_safe(df, k):  c = cols[k]; return float(df[c].sum()) if c else None
 
     # --- Aggregates for selected location
     agg = {
@@ -117,7 +154,6 @@ def render(df_reduced: gpd.GeoDataFrame, dguid: str, lat: float, lon: float):
     # --- KPI Display
     st.subheader("🔑 Key Aggregates (Selected Radius vs GTA)")
 
-    # New code for KPI
     def kpi(label, val, comp):
         if val is None or comp is None or pd.isna(val) or pd.isna(comp):
             st.write(f"**{label}**: —")
@@ -159,33 +195,6 @@ def render(df_reduced: gpd.GeoDataFrame, dguid: str, lat: float, lon: float):
                 unsafe_allow_html=True,
             )
 
-    """
-    OLD KPI CODE
-    def kpi(label, val, comp):
-        if val is None or comp is None or pd.isna(val) or pd.isna(comp):
-            st.write(f"**{label}**: —")
-            return
-        delta = val - comp
-        if delta > 0:
-            delta_color = "normal"
-        elif delta < 0:
-            delta_color = "inverse"
-        else:
-            delta_color = "off"
-
-        low = label.lower()
-        if "income" in low:
-            st.metric(label, f"${val:,.0f}", f"{delta:,.0f} vs GTA", delta_color=delta_color)
-        elif "density" in low:
-            st.metric(label, f"{val:,.1f} ppl/km²", f"{delta:,.1f} vs GTA", delta_color=delta_color)
-        elif "growth" in low or "%" in low:
-            st.metric(label, f"{val:+.1f}%", f"{delta:+.1f}% vs GTA", delta_color=delta_color)
-        elif "population" in low:
-            st.metric(label, f"{val:,.0f}", f"{delta:,.0f} vs GTA", delta_color=delta_color)
-        else:
-            st.metric(label, f"{val:,.2f}", f"{delta:,.2f} vs GTA", delta_color=delta_color)
-    """
-
     c1, c2, c3, c4, c5 = st.columns(5)
     with c1: kpi("Median income (2020)", agg["Median income (2020)"], gta_avg["Median income (2020)"])
     with c2: kpi("Average income (2020)", agg["Average income (2020)"], gta_avg["Average income (2020)"])
@@ -2,12 +2,19 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import multiprocessing
+import os
 import re
 from collections import Counter
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
+from utils.geospatial import dguid_mask
+
+
 SIA = SentimentIntensityAnalyzer()
+PARALLEL_MIN_REVIEWS = 2000  # below this, process start-up costs more than it saves
 
 # ---------- helpers ----------
 def _label(c: float) -> str:
@@ -24,32 +31,37 @@ def _arrow(diff: float, good_when_positive: bool = True):
     else:
         return ("⬇️", "green") if diff > 0 else ("⬆️", "red")
 
-def _normalize_text(s: str) -> str:
-    s = str(s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s.lower()
+_WS_RE = re.compile(r"\s+")
+_URL_RE = re.compile(r"http\S+|www\.\S+")
+_NON_WORD_RE = re.compile(r"[^a-z0-9\s']")
 
-def _normalize_text_for_issues(s: str) -> str:
-    s = str(s).lower()
-    s = re.sub(r"http\S+|www\.\S+", " ", s)
-    s = re.sub(r"[^a-z0-9\s']", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+def _clean_texts(texts: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """
+    Vectorized text clean-up in one chain: (lowercased, whitespace-collapsed text used for
+    dedupe; the same with URLs and punctuation removed, used for issue matching).
+    """
+    norm = texts.str.lower().str.replace(_WS_RE, " ", regex=True).str.strip()
+    issues = (norm.str.replace(_URL_RE, " ", regex=True)
+                  .str.replace(_NON_WORD_RE, " ", regex=True)
+                  .str.replace(_WS_RE, " ", regex=True)
+                  .str.strip())
+    return norm, issues
+
+_STOP = frozenset("""
+    a about above after again against all am an and any are as at be because been before being below
+    between both but by could did do does doing down during each few for from further had has have having he
+    her here hers herself him himself his how i if in into is it its itself just me more most my myself no nor
+    not of off on once only or other our ours ourselves out over own same she should so some such than that the
+    their theirs them themselves then there these they this those through to too under until up very was we were
+    what when where which while who whom why with you your yours yourself yourselves
+""".split())
 
 def _bigram_phrases(texts, topk=8):
-    stop = set("""
-        a about above after again against all am an and any are as at be because been before being below
-        between both but by could did do does doing down during each few for from further had has have having he
-        her here hers herself him himself his how i if in into is it its itself just me more most my myself no nor
-        not of off on once only or other our ours ourselves out over own same she should so some such than that the
-        their theirs them themselves then there these they this those through to too under until up very was we were
-        what when where which while who whom why with you your yours yourself yourselves
-    """.split())
+    # texts are already normalized for issue matching (see _clean_texts)
     grams = Counter()
     for t in texts:
-        toks = [w for w in _normalize_text_for_issues(t).split() if w not in stop and len(w) > 2]
-        for i in range(len(toks) - 1):
-            grams.update([f"{toks[i]} {toks[i+1]}"])
+        toks = [w for w in t.split() if w not in _STOP and len(w) > 2]
+        grams.update(f"{a} {b}" for a, b in zip(toks, toks[1:]))
     return grams.most_common(topk)
 
 # Practical, editable taxonomy (tune keywords as you see real data)
@@ -91,19 +103,83 @@ ISSUE_RULES: dict[str, list[str]] = {
 }
 
 def _compile_issue_patterns(rules: dict[str, list[str]]):
+    # One alternation per issue: a single regex pass per text instead of one search per keyword
     compiled = {}
     for issue, kws in rules.items():
-        pats = []
-        for k in kws:
-            k = k.strip()
-            pats.append(re.compile(rf"\b{k}\b", re.I))
-        compiled[issue] = pats
+        alt = "|".join(re.escape(k.strip()) for k in kws)
+        compiled[issue] = re.compile(rf"\b(?:{alt})\b", re.I)
     return compiled
 
 ISSUE_PATTERNS = _compile_issue_patterns(ISSUE_RULES)
 
+def _score_batch(texts: list[str]) -> list[dict]:
+    return [SIA.polarity_scores(t) for t in texts]
+
+def _polarity_records(texts: list[str]) -> list[dict]:
+    # VADER is pure Python (GIL-bound), so it scales with processes rather than threads.
+    # Count the CPUs this process may run on (container limits), not the host's.
+    usable = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    workers = min(usable or 1, 8)
+    if workers < 2 or len(texts) < PARALLEL_MIN_REVIEWS:
+        return _score_batch(texts)
+    size = -(-len(texts) // (workers * 4))
+    chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+    try:
+        # forkserver: forking the multi-threaded Streamlit server directly can deadlock
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            return [rec for batch in pool.map(_score_batch, chunks) for rec in batch]
+    except (OSError, BrokenProcessPool):
+        return _score_batch(texts)  # no worker processes available here: score in-process
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def score_reviews(version: tuple, _pcr_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    _pcr_df plus VADER neg/neu/pos/compound scores and a sentiment label for every review,
+    the normalized texts (__norm_text, __norm_text_issues) and a 64-bit hash of __norm_text
+    (__text_hash) used as the dedupe key. Text is stored as str.
+    Scored once per loaded frame (keyed on the reviews_version from load_reviews);
+    the result is shared, so callers must .copy() before mutating.
+    """
+    texts = _pcr_df["Text"].astype(str)
+    records = _polarity_records(texts.tolist())
+    scores = pd.DataFrame.from_records(records, index=_pcr_df.index)
+    scored = pd.concat([_pcr_df, scores], axis=1)
+    scored["sentiment"] = scored["compound"].map(_label)
+    scored["Text"] = texts
+    scored["__norm_text"], scored["__norm_text_issues"] = _clean_texts(texts)
+    # Dedupe compares 8-byte keys instead of hashing full review strings on every render
+    scored["__text_hash"] = pd.util.hash_pandas_object(scored["__norm_text"], index=False)
+    return scored
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _gta_sentiment(version: tuple, _pcr_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-DGUID Positive/Negative counts and pos_share/neg_share over the whole review frame,
+    indexed by DGUID. Depends only on the loaded frame, so it is computed once per frame.
+    """
+    scored = score_reviews(version, _pcr_df)
+    scored = scored[scored["__norm_text"].str.len() > 0]
+
+    # (Optional) light dedupe per DGUID for fairer baseline
+    if "Place ID" in scored.columns:
+        scored = scored.sort_values("DGUID").drop_duplicates(subset=["DGUID", "Place ID", "__text_hash"])
+    else:
+        scored = scored.sort_values("DGUID").drop_duplicates(subset=["DGUID", "__text_hash"])
+
+    # One groupby-sum over two boolean columns (rather than value_counts + unstack)
+    grp = pd.DataFrame({
+        "Positive": (scored["sentiment"] == "Positive").to_numpy(),
+        "Negative": (scored["sentiment"] == "Negative").to_numpy(),
+    }).groupby(scored["DGUID"].to_numpy()).sum()
+    grp["den"] = grp["Positive"] + grp["Negative"]
+    grp = grp[grp["den"] > 0].copy()
+    grp["pos_share"] = grp["Positive"] / grp["den"]
+    grp["neg_share"] = grp["Negative"] / grp["den"]
+    return grp
+
 # ---------- main render ----------
-def render(dguid: str, pcr_df: pd.DataFrame):
+def render(dguid: str, pcr_df: pd.DataFrame, reviews_version: tuple):
     """
     Physio reviews only (pcr_with_DGUID.csv assumed).
     Columns expected: DGUID, Text (Rating optional, Place ID optional, Time optional).
@@ -117,17 +193,19 @@ def render(dguid: str, pcr_df: pd.DataFrame):
         st.error(f"Missing columns in physio reviews: {', '.join(sorted(missing))}")
         return
 
-    # 1) Filter to selected DGUID
-    df_local = pcr_df[pcr_df["DGUID"].astype(str) == str(dguid)].copy()
-    raw_count = len(df_local)
-    if df_local.empty:
+    # 1) Filter to selected DGUID. A DGUID without reviews returns here, before any scoring
+    #    or GTA baseline work; otherwise rows come already scored from the cached frame.
+    local_mask = dguid_mask(pcr_df["DGUID"], dguid)
+    raw_count = int(local_mask.sum())
+    if raw_count == 0:
         st.info("No physio reviews found for this DGUID.")
         return
 
-    # Clean empties
-    df_local["Text"] = df_local["Text"].astype(str)
-    df_local["__norm_text"] = df_local["Text"].apply(_normalize_text)
-    df_local = df_local[df_local["__norm_text"].str.len() > 0].copy()
+    all_scored = score_reviews(reviews_version, pcr_df)  # row-aligned with pcr_df
+    df_local = all_scored[local_mask]
+
+    # Clean empties (boolean indexing already returns a new frame, so no extra copy is needed)
+    df_local = df_local[df_local["__norm_text"].str.len() > 0]
     cleaned_count = len(df_local)
 
     # ---- DEDUPLICATION ----
@@ -141,19 +219,16 @@ def render(dguid: str, pcr_df: pd.DataFrame):
 
     # Choose best key: Place ID + text; else Facility Name + text; else text only
     if "Place ID" in df_local.columns:
-        dedupe_keys = ["Place ID", "__norm_text"]
+        dedupe_keys = ["Place ID", "__text_hash"]
     elif "Facility Name" in df_local.columns:
-        dedupe_keys = ["Facility Name", "__norm_text"]
+        dedupe_keys = ["Facility Name", "__text_hash"]
     else:
-        dedupe_keys = ["__norm_text"]
+        dedupe_keys = ["__text_hash"]
 
-    df_local = df_local.drop_duplicates(subset=dedupe_keys, keep="first").copy()
+    df_local = df_local.drop_duplicates(subset=dedupe_keys, keep="first")
     deduped_count = len(df_local)
 
-    # Sentiment
-    scores_local = df_local["Text"].apply(lambda t: SIA.polarity_scores(t)).apply(pd.Series)
-    df_local = pd.concat([df_local, scores_local], axis=1)
-    df_local["sentiment"] = df_local["compound"].apply(_label)
+    # Sentiment (neg/neu/pos/compound/sentiment) comes precomputed from score_reviews
 
     # Local counts/shares (ignore neutrals)
     pos_local = int((df_local["sentiment"] == "Positive").sum())
@@ -171,29 +246,7 @@ def render(dguid: str, pcr_df: pd.DataFrame):
     )
 
     # 2) GTA baselines (MEAN across DGUIDs of per-DGUID shares)
-    scored = pcr_df.copy()
-    scored["Text"] = scored["Text"].astype(str)
-    scored["__norm_text"] = scored["Text"].apply(_normalize_text)
-    scored = scored[scored["__norm_text"].str.len() > 0]
-
-    # (Optional) light dedupe per DGUID for fairer baseline
-    if "Place ID" in scored.columns:
-        scored = scored.sort_values("DGUID").drop_duplicates(subset=["DGUID", "Place ID", "__norm_text"])
-    else:
-        scored = scored.sort_values("DGUID").drop_duplicates(subset=["DGUID", "__norm_text"])
-
-    sc = scored["Text"].apply(lambda t: SIA.polarity_scores(t)).apply(pd.Series)
-    scored = pd.concat([scored, sc], axis=1)
-    scored["sentiment"] = scored["compound"].apply(_label)
-
-    grp = scored.groupby("DGUID")["sentiment"].value_counts().unstack(fill_value=0)
-    for col in ["Positive", "Negative"]:
-        if col not in grp.columns:
-            grp[col] = 0
-    grp["den"] = grp["Positive"] + grp["Negative"]
-    grp = grp[grp["den"] > 0].copy()
-    grp["pos_share"] = grp["Positive"] / grp["den"]
-    grp["neg_share"] = grp["Negative"] / grp["den"]
+    grp = _gta_sentiment(reviews_version, pcr_df)
 
     gta_pos_share_avg = float(grp["pos_share"].mean()) if not grp.empty else np.nan
     gta_neg_share_avg = float(grp["neg_share"].mean()) if not grp.empty else np.nan
@@ -239,24 +292,29 @@ def render(dguid: str, pcr_df: pd.DataFrame):
     # 4) Issues mining (themes)
     st.subheader("🔎 Commonly discussed issues (local)")
 
-    df_local["__norm_text_issues"] = df_local["Text"].apply(_normalize_text_for_issues)
-    # build issue flags
-    issue_cols = []
-    for issue, patterns in ISSUE_PATTERNS.items():
-        col = f"ISSUE::{issue}"
-        issue_cols.append(col)
-        df_local[col] = df_local["__norm_text_issues"].apply(lambda t: int(any(p.search(t) for p in patterns)))
-
-    neg_mask = df_local["sentiment"] == "Negative"
+    neg_mask = (df_local["sentiment"] == "Negative").to_numpy()
     total_neg = int(neg_mask.sum())
 
+    # Per-review issue flags are only needed for negatives (counts, phrases, quotes); the other
+    # reviews only contribute a match count to "All mentions"
+    issue_cols = [f"ISSUE::{issue}" for issue in ISSUE_PATTERNS]
+    neg_df = df_local[neg_mask].copy()
+    other_texts = df_local.loc[~neg_mask, "__norm_text_issues"]
+    texts = neg_df["__norm_text_issues"].tolist()
+    flags = np.zeros((len(texts), len(issue_cols)), dtype=np.uint8)
+    other_mentions = {}
+    for j, (issue, pattern) in enumerate(ISSUE_PATTERNS.items()):
+        flags[:, j] = [pattern.search(t) is not None for t in texts]
+        other_mentions[issue] = int(other_texts.str.contains(pattern).sum())
+    neg_df[issue_cols] = flags
+
     rows = []
     for issue, col in zip(ISSUE_RULES.keys(), issue_cols):
-        mentions_all = int(df_local[col].sum())
-        mentions_neg = int(df_local.loc[neg_mask, col].sum())
+        mentions_neg = int(neg_df[col].sum())
+        mentions_all = mentions_neg + other_mentions[issue]
         share_neg = (mentions_neg / total_neg * 100.0) if total_neg > 0 else 0.0
 
-        texts_for_issue = df_local.loc[neg_mask & (df_local[col] == 1), "Text"].tolist()
+        texts_for_issue = neg_df.loc[neg_df[col] == 1, "__norm_text_issues"].tolist()
         top_ph = _bigram_phrases(texts_for_issue, topk=1)
         sample = top_ph[0][0] if top_ph else ""
 
@@ -279,18 +337,20 @@ def render(dguid: str, pcr_df: pd.DataFrame):
 
         # simple horizontal bar of top negative mentions
         top = issues_df.head(8)
-        fig, ax = plt.subplots(figsize=(7, 4))
-        ax.barh(top["Issue"][::-1], top["Mentions (neg)"][::-1])
-        ax.set_xlabel("Mentions in negative reviews")
-        ax.set_ylabel("")
-        ax.set_title("Top issues (negative reviews)")
-        st.pyplot(fig)
+        import altair as alt  # only imported when there is something to plot
+
+        # A Vega-Lite spec rendered client-side, instead of rasterizing a matplotlib figure per rerun
+        chart = alt.Chart(top[["Issue", "Mentions (neg)"]]).mark_bar().encode(
+            x=alt.X("Mentions (neg):Q", title="Mentions in negative reviews"),
+            y=alt.Y("Issue:N", sort=None, title=None),  # keep table order: top issue first
+        ).properties(title="Top issues (negative reviews)")
+        st.altair_chart(chart, use_container_width=True)
 
         # Representative quotes per top issue
         st.subheader("💬 Representative quotes (negative)")
         for issue in top["Issue"].tolist():
             col = f"ISSUE::{issue}"
-            examples = df_local.loc[neg_mask & (df_local[col] == 1), "Text"].dropna().astype(str)
+            examples = neg_df.loc[neg_df[col] == 1, "Text"].dropna().astype(str)
             examples = sorted(examples, key=lambda s: len(s))[:3]
             if not examples:
                 continue
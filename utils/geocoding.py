@@ -0,0 +1,70 @@
+import re
+import shelve
+import threading
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+
+# Geocoding cache: st.cache_data memoizes within the process, the shelve file
+# keeps successful lookups across restarts so repeat addresses never hit the API.
+GEO_CACHE_PATH = str(Path.home() / ".arrow_geo_cache")
+GEO_CACHE_TTL = 7 * 24 * 3600
+_geo_cache_lock = threading.Lock()
+
+# One pooled session: reuses the TCP/TLS connection to the Geocoding API across lookups
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+GEOCODE_TIMEOUT = 5
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+def _normalize_address(address):
+    """Lowercase, drop punctuation and collapse whitespace so equivalent inputs share a cache key."""
+    address = re.sub(r"[^\w\s-]", " ", str(address).lower())
+    return re.sub(r"\s+", " ", address).strip()
+
+def _geo_cache_get(key):
+    try:
+        with _geo_cache_lock, shelve.open(GEO_CACHE_PATH) as cache:
+            return cache.get(key)
+    except Exception:
+        return None
+
+def _geo_cache_put(key, value):
+    try:
+        with _geo_cache_lock, shelve.open(GEO_CACHE_PATH) as cache:
+            cache[key] = value
+    except Exception:
+        pass
+
+@st.cache_data(ttl=GEO_CACHE_TTL, show_spinner=False)
+def _geocode_cached(address_norm, api_key, _address_raw):
+    # address_norm is only the cache key; the API gets the user's text, whose "#", "," and "/"
+    # separators the geocoder relies on (_address_raw is excluded from the st.cache_data key)
+    hit = _geo_cache_get(address_norm)
+    if hit is not None:
+        return hit
+
+    response = _SESSION.get(
+        GEOCODE_URL,
+        params={"address": _address_raw, "key": api_key},
+        timeout=GEOCODE_TIMEOUT,
+    ).json()
+    if response["status"] == "OK":
+        result = response["results"][0]
+        location = result["geometry"]["location"]
+        hit = (location["lat"], location["lng"], result["formatted_address"])
+        _geo_cache_put(address_norm, hit)
+        return hit
+    if response["status"] == "ZERO_RESULTS":
+        return None, None, None
+    # Quota / key / server errors are transient: raise so st.cache_data does not memoize them
+    raise RuntimeError(f"Geocoding failed: {response['status']}")
+
+def geocode_address(address, api_key):
+    try:
+        return _geocode_cached(_normalize_address(address), api_key, str(address).strip())
+    except (RuntimeError, requests.RequestException):
+        # Transient failure (API error, timeout, network): report "not found" instead of crashing the page
+        return None, None, None
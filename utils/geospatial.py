@@ -1,23 +1,117 @@
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+import shapely
 from shapely.geometry import Point
-from shapely.wkt import loads as wkt_loads
+
+EARTH_RADIUS_KM = 6371.0088
 
 def get_dguid_from_latlon(lat, lon, df_reduced):
     """
     Given a lat/lon and df_reduced, return the DGUID of the matching census tract.
+    df_reduced must be the GeoDataFrame from load_all_data (geometry is decoded from the
+    GeoParquet sidecar there, not parsed from WKT here).
+    The lookup goes through the frame's STRtree (`.sindex`), which geopandas builds once and
+    keeps on the cached frame, so each call is a tree query instead of a scan of every polygon.
     """
-    # Convert geometry column if needed
-    if not isinstance(df_reduced, gpd.GeoDataFrame):
-        df_reduced['geometry'] = df_reduced['geometry'].apply(wkt_loads)
-        df_reduced = gpd.GeoDataFrame(df_reduced, geometry='geometry', crs='EPSG:4326')
-
     # Create point from input
     point = Point(lon, lat)
 
-    # Spatial match
-    match = df_reduced[df_reduced.geometry.contains(point)]
+    # Spatial match: tracts whose polygon contains the point (first in row order wins)
+    match = df_reduced.sindex.query(point, predicate="within")
 
-    if not match.empty:
-        return match.iloc[0]['DGUID']
+    if len(match):
+        # Read the one cell rather than materializing the whole tract row
+        return df_reduced['DGUID'].iat[match.min()]
     else:
         return None
+
+def dguid_mask(dguids: pd.Series, dguid) -> np.ndarray:
+    """
+    Boolean mask of the rows whose DGUID equals `dguid`. On the categorical columns produced
+    by load_data._compact this is one lookup of the category code plus an integer compare.
+    """
+    if isinstance(dguids.dtype, pd.CategoricalDtype):
+        cats = dguids.cat.categories
+        if str(dguid) not in cats:
+            return np.zeros(len(dguids), dtype=bool)
+        return dguids.cat.codes.to_numpy() == cats.get_loc(str(dguid))
+    return (dguids.astype(str) == str(dguid)).to_numpy()
+
+def haversine_km(lat_arr, lon_arr, lat0, lon0):
+    """
+    Vectorized great-circle distance (km) from (lat0, lon0) to every point in lat_arr/lon_arr.
+    Within ~0.5% of geodesic distance, which is irrelevant at the dashboard's km-scale radii.
+    """
+    lat = np.radians(np.asarray(lat_arr, dtype=float))
+    lon = np.radians(np.asarray(lon_arr, dtype=float))
+    lat0, lon0 = np.radians(lat0), np.radians(lon0)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def _bbox_deg(lat0, radius_km):
+    # 1 degree of latitude ~ 111 km; longitude degrees shrink with cos(lat)
+    return radius_km / 111.0, radius_km / (111.0 * np.cos(np.radians(lat0)))
+
+def bbox_mask(lat_arr, lon_arr, lat0, lon0, radius_km):
+    """
+    Cheap lat/lon bounding-box prefilter: True for points that may lie within radius_km of (lat0, lon0).
+    """
+    dlat_deg, dlon_deg = _bbox_deg(lat0, radius_km)
+    return (np.abs(lat_arr - lat0) <= dlat_deg) & (np.abs(lon_arr - lon0) <= dlon_deg)
+
+def build_point_index(df):
+    """
+    STRtree over the Longitude/Latitude points of df, built once and reused for every radius query.
+    """
+    points = shapely.points(df["Longitude"].to_numpy(dtype=float), df["Latitude"].to_numpy(dtype=float))
+    return shapely.STRtree(points)
+
+def within_radius(df, lat, lon, radius_km, index=None, mask=None):
+    """
+    Rows of df (Latitude/Longitude columns) within radius_km of (lat, lon), with a Distance_km column.
+    Candidates come from `index` (build_point_index on the same rows) when given, else from a linear
+    bounding-box mask; `mask` optionally restricts rows further. Only the final rows are copied.
+    """
+    lat_arr = df["Latitude"].to_numpy(dtype=float)
+    lon_arr = df["Longitude"].to_numpy(dtype=float)
+    if index is not None:
+        dlat_deg, dlon_deg = _bbox_deg(lat, radius_km)
+        pos = np.sort(index.query(shapely.box(lon - dlon_deg, lat - dlat_deg, lon + dlon_deg, lat + dlat_deg)))
+    else:
+        pos = np.flatnonzero(bbox_mask(lat_arr, lon_arr, lat, lon, radius_km))
+    if mask is not None:
+        pos = pos[np.asarray(mask, dtype=bool)[pos]]
+
+    dist = haversine_km(lat_arr[pos], lon_arr[pos], lat, lon)
+    keep = dist <= radius_km
+    return df.iloc[pos[keep]].assign(Distance_km=dist[keep])
+
+def to_wgs84(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Return gdf in EPSG:4326 (assumed when it has no CRS); a no-op when it already is.
+    """
+    if gdf.crs is None:
+        return gdf.set_crs("EPSG:4326")
+    if gdf.crs.to_epsg() == 4326:
+        return gdf
+    return gdf.to_crs("EPSG:4326")
+
+def ensure_lat_lon(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return a copy of df with numeric Latitude/Longitude columns, taken from existing
+    lat/lon columns or else from the geometry centroids (EPSG:4326).
+    """
+    df = df.copy()
+    lat_col = next((c for c in df.columns if c.lower() in ("latitude", "lat")), None)
+    lon_col = next((c for c in df.columns if c.lower() in ("longitude", "lon")), None)
+    if lat_col and lon_col:
+        df["Latitude"] = pd.to_numeric(df[lat_col], errors="coerce")
+        df["Longitude"] = pd.to_numeric(df[lon_col], errors="coerce")
+        return df
+    if "geometry" in df.columns:
+        gdf = to_wgs84(df if isinstance(df, gpd.GeoDataFrame) else gpd.GeoDataFrame(df, geometry="geometry", crs=None))
+        cent = gdf.geometry.centroid
+        df["Latitude"], df["Longitude"] = cent.y, cent.x
+        return df
+    raise ValueError("Data has no Latitude/Longitude or geometry.")
@@ -1,15 +1,121 @@
+import os
+from pathlib import Path
+
 import pandas as pd
 import geopandas as gpd
+import streamlit as st
 
-def load_all_data():
-    df_reduced = pd.read_csv("data/df_reduced.csv")
+from utils.geospatial import build_point_index, ensure_lat_lon, to_wgs84
+
+CACHE_DIR = Path("cache")
+TRACTS_CSV = "data/df_reduced.csv"
+PHYSIO_GEOJSON = "data/gdf_physio_DGUID.geojson"
+HOSPITALS_GEOJSON = "data/gdf_hospitals_DGUID.geojson"
+PHYSIO_REVIEWS_CSV = "data/pcr_with_DGUID.csv"
+FACILITY_REVIEWS_CSV = "data/sfr_with_DGUID.csv"
+
+def _source_versions(*paths):
+    # (mtime_ns, size) per source file: part of the cache key, so replacing a data file
+    # (even with an older mtime) reloads it without restarting the app
+    return tuple((s.st_mtime_ns, s.st_size) for s in map(os.stat, paths))
+
+def _read_geojson(path):
+    # pyogrio's Arrow path decodes the features in C instead of building Python dicts per feature
+    return gpd.read_file(path, engine="pyogrio", use_arrow=True)
+
+def _read_with_sidecar(src, reader, geo=False):
+    """
+    Read `src` with `reader` once and keep a Parquet copy in CACHE_DIR; later loads read the
+    Parquet file (columnar, geometry as WKB) while the source keeps the exact mtime and size
+    recorded in the sidecar's name. Any other source file (newer, older or restored) is re-read.
+    """
+    src = Path(src)
+    st_src = src.stat()
+    sidecar = CACHE_DIR / f"{src.stem}.{st_src.st_mtime_ns}-{st_src.st_size}.parquet"
+    if sidecar.exists():
+        try:
+            return gpd.read_parquet(sidecar) if geo else pd.read_parquet(sidecar)
+        except Exception:
+            pass  # unreadable / partial sidecar: fall back to the source and rewrite it
+
+    df = reader(src)
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp = sidecar.with_suffix(".tmp")
+        df.to_parquet(tmp)
+        os.replace(tmp, sidecar)
+        # Drop sidecars written for earlier versions of this source
+        for old in [CACHE_DIR / f"{src.stem}.parquet", *CACHE_DIR.glob(f"{src.stem}.*.parquet")]:
+            if old != sidecar and old.exists():
+                old.unlink()
+    except Exception:
+        pass  # read-only filesystem etc.: keep serving from the source file
+    return df
+
+def _read_tracts(path):
+    df_reduced = pd.read_csv(path)
     df_reduced.columns = df_reduced.columns.str.strip()  # <--- NEW LINE
+    # Parse the WKT geometry once so the shared frame is already a GeoDataFrame
+    df_reduced["geometry"] = gpd.GeoSeries.from_wkt(df_reduced["geometry"])
+    return gpd.GeoDataFrame(df_reduced, geometry="geometry", crs="EPSG:4326")
 
-    gdf_physio = gpd.read_file("data/gdf_physio_DGUID.geojson")
-    gdf_hospitals = gpd.read_file("data/gdf_hospitals_DGUID.geojson")
+def _compact(df, float32_cols=()):
+    """
+    Downcast the given numeric columns to float32 and dictionary-encode DGUID, so groupbys
+    and filters on the shared frames touch less memory (DGUID compares become int codes).
+    """
+    for c in float32_cols:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+    if "DGUID" in df.columns:
+        df["DGUID"] = df["DGUID"].astype("category")
+    return df
+
+# Frames are held with cache_resource (shared, never pickled); callers
+# must treat them as read-only and .copy() before mutating.
+def load_all_data():
+    """
+    (df_reduced, gdf_physio, gdf_hospitals, data_version). data_version identifies the source
+    files the frames were read from; caches derived from these frames key on it.
+    """
+    data_version = _source_versions(TRACTS_CSV, PHYSIO_GEOJSON, HOSPITALS_GEOJSON)
+    return (*_load_all_data(data_version), data_version)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_all_data(data_version):
+    df_reduced = _read_with_sidecar(TRACTS_CSV, _read_tracts, geo=True)
+    df_reduced = _compact(df_reduced, ["Population, 2021"])
+    df_reduced.sindex  # build the tract STRtree now, so the first DGUID/radius query doesn't pay for it
+
+    # CRS is normalized once here, so nothing downstream reprojects per interaction
+    gdf_physio = _read_with_sidecar(PHYSIO_GEOJSON, _read_geojson, geo=True)
+    gdf_hospitals = _read_with_sidecar(HOSPITALS_GEOJSON, _read_geojson, geo=True)
+    gdf_physio = ensure_lat_lon(to_wgs84(gdf_physio))
+    gdf_hospitals = ensure_lat_lon(to_wgs84(gdf_hospitals))
+    if {"Name", "Address"} <= set(gdf_hospitals.columns):
+        gdf_hospitals["Is_Duplicate"] = gdf_hospitals.duplicated(subset=["Name", "Address"])
+
+    # Ratings stay float64: float32 means round differently in the displayed averages
+    gdf_physio = _compact(gdf_physio)
+    gdf_hospitals = _compact(gdf_hospitals)
     return df_reduced, gdf_physio, gdf_hospitals
 
+def load_point_indexes():
+    """Spatial indexes over the clinic and facility points returned by load_all_data()."""
+    return _load_point_indexes(_source_versions(PHYSIO_GEOJSON, HOSPITALS_GEOJSON))
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_point_indexes(data_version):
+    _, gdf_physio, gdf_hospitals, _ = load_all_data()
+    return build_point_index(gdf_physio), build_point_index(gdf_hospitals)
+
 def load_reviews():
-    pcr = pd.read_csv("data/pcr_with_DGUID.csv")
-    sfr = pd.read_csv("data/sfr_with_DGUID.csv")
+    """(pcr, sfr, reviews_version), with reviews_version as data_version in load_all_data()."""
+    reviews_version = _source_versions(PHYSIO_REVIEWS_CSV, FACILITY_REVIEWS_CSV)
+    return (*_load_reviews(reviews_version), reviews_version)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_reviews(reviews_version):
+    pcr = _compact(_read_with_sidecar(PHYSIO_REVIEWS_CSV, pd.read_csv))
+    sfr = _compact(_read_with_sidecar(FACILITY_REVIEWS_CSV, pd.read_csv))
     return pcr, sfr